@@ -1,9 +1,14 @@
 import os
+import gzip
 import json
 import uuid
 import html
+import inspect
+from collections import defaultdict, deque
 import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Optional: sidebar drag-and-drop (pip install streamlit-sortables)
 try:
@@ -12,25 +17,46 @@ try:
 except Exception:
     HAS_SORT = False
 
+# Releases that accept ids= hand the reordered ids back directly.
+try:
+    SORT_HAS_IDS = HAS_SORT and "ids" in inspect.signature(sort_items).parameters
+except (TypeError, ValueError):
+    SORT_HAS_IDS = False
+
+# Optional: faster JSON encode/decode for webhook payloads (pip install orjson)
+try:
+    import orjson
+    HAS_ORJSON = True
+except Exception:
+    HAS_ORJSON = False
+
 st.set_page_config(page_title="Content Brief Generator", layout="wide")
 
 # ---------- Load styles ----------
-def load_css(path: str = "styles.css"):
+@st.cache_data(show_spinner=False)
+def _read_asset_cached(path: str, mtime: float) -> str:
+    # mtime is only part of the cache key, so editing the file invalidates it.
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def _read_asset(path: str) -> str:
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+        return _read_asset_cached(path, os.path.getmtime(path))
     except FileNotFoundError:
-        pass
+        return ""
+
+def load_css(path: str = "styles.css"):
+    css = _read_asset(path)
+    if css:
+        st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
 
 load_css()
 
 
 def load_js(path: str):
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            st.markdown(f"<script>{f.read()}</script>", unsafe_allow_html=True)
-    except FileNotFoundError:
-        pass
+    js = _read_asset(path)
+    if js:
+        st.markdown(f"<script>{js}</script>", unsafe_allow_html=True)
 
 
 load_js("QuickHeadingRegenerate.js")
@@ -43,15 +69,29 @@ QUICK_REGEN_WEBHOOK_URL = (
     or "https://app.aiseoacademy.co/webhook/a912237e-6a27-4f4d-bf61-418ae9502f59"
 )
 AUTH_HEADER = st.secrets.get("N8N_AUTH_HEADER") or os.getenv("N8N_AUTH_HEADER")
+GZIP_MIN_BYTES = 1024
+# (connect, read): fail fast on an unreachable host, but give the workflow time to run.
+WEBHOOK_TIMEOUT = (5, 180)
+# Longest Retry-After we honour; the script thread sleeps through it with the overlay up.
+RETRY_AFTER_MAX = 10
 
-GROUPS = ["MainContent", "SupplementaryContent"]
+GROUPS = ("MainContent", "SupplementaryContent")
 GROUP_LABELS = {
     "MainContent": "Main Content",
     "SupplementaryContent": "Supplementary Content",
 }
-ANSWER_TYPES = ["Auto", "EDA", "DDA", "L+LD", "S+L+LD", "EOE"]
-ANSWER_LENGTHS = ["Small", "Medium", "Large"]
-LEVELS = ["H2", "H3", "H4", "H5", "H6"]
+_group_label = GROUP_LABELS.__getitem__
+ANSWER_TYPES = ("Auto", "EDA", "DDA", "L+LD", "S+L+LD", "EOE")
+ANSWER_LENGTHS = ("Small", "Medium", "Large")
+ANSWER_TYPE_SET = frozenset(ANSWER_TYPES)
+ANSWER_LENGTH_SET = frozenset(ANSWER_LENGTHS)
+LEVELS = ("H2", "H3", "H4", "H5", "H6")
+LEVEL_IDX = {lvl: i for i, lvl in enumerate(LEVELS)}
+LEVEL_INDENT = {lvl: " " * i for i, lvl in enumerate(LEVELS)}
+LEVEL_RAISE = {lvl: LEVELS[max(i - 1, 0)] for i, lvl in enumerate(LEVELS)}
+LEVEL_LOWER = {lvl: LEVELS[min(i + 1, len(LEVELS) - 1)] for i, lvl in enumerate(LEVELS)}
+MAX_SIDEBAR_ITEMS = 50
+WIDGET_FIELDS = ("heading_name", "desc", "atype", "alen", "lock", "subseq")
 
 # ---------- Session bootstrap ----------
 st.session_state.setdefault("session_id", str(uuid.uuid4()))
@@ -60,7 +100,15 @@ st.session_state.setdefault("H1_text", "")
 st.session_state.setdefault("H1_lock", False)
 st.session_state.setdefault("feedback", "")
 st.session_state.setdefault("hydrated_once", False)
-st.session_state.setdefault("_waiting", False)
+st.session_state.setdefault("_section_seq", 0)
+
+def _next_section_id():
+    # Module globals reset on every rerun, so the counter lives in session state.
+    # Ids are never reused within a session, which keeps widget keys unique, and
+    # the session prefix keeps the heading_id sent to quick regen distinct
+    # across sessions.
+    st.session_state["_section_seq"] += 1
+    return f"{st.session_state['session_id'][:8]}-{st.session_state['_section_seq']:x}"
 
 def _new_section(
     heading_name="",
@@ -72,12 +120,12 @@ def _new_section(
     gen_subsequent=False,
 ):
     return {
-        "id": str(uuid.uuid4()),
-        "heading": level if level in LEVELS else "H2",
+        "id": _next_section_id(),
+        "heading": level if level in LEVEL_IDX else "H2",
         "heading_name": heading_name or "",
         "description": description or "",
-        "answer_type": answer_type if answer_type in ANSWER_TYPES else "Auto",
-        "answer_length": answer_length if answer_length in ANSWER_LENGTHS else "Medium",
+        "answer_type": answer_type if answer_type in ANSWER_TYPE_SET else "Auto",
+        "answer_length": answer_length if answer_length in ANSWER_LENGTH_SET else "Medium",
         "lock": bool(lock),
         "subsequent": bool(gen_subsequent),
     }
@@ -126,20 +174,23 @@ def _hydrate_from_pending():
     if not st.session_state.get("H1_text"):
         st.session_state["H1_text"] = pending.get("H1", "") or ""
 
+    sections = st.session_state["sections"]
     for group in GROUPS:
-        incoming = pending.get(group, []) or []
-        for item in incoming:
-            st.session_state["sections"][group].append(
-                _new_section(
-                    heading_name=item.get("H2", ""),
-                    level=item.get("HeadingLevel", "H2"),
-                    description=item.get("Methodology", ""),
-                    answer_type=item.get("Answer Type", "Auto"),
-                    answer_length=item.get("Answer Length", "Medium"),
-                    lock=item.get("lock", False),
-                    gen_subsequent=(item.get("Subsequent Sections?", "No") == "Yes"),
-                )
+        incoming = pending.get(group)
+        if not incoming:
+            continue
+        sections[group].extend([
+            _new_section(
+                heading_name=item.get("H2", ""),
+                level=item.get("HeadingLevel", "H2"),
+                description=item.get("Methodology", ""),
+                answer_type=item.get("Answer Type", "Auto"),
+                answer_length=item.get("Answer Length", "Medium"),
+                lock=item.get("lock", False),
+                gen_subsequent=(item.get("Subsequent Sections?", "No") == "Yes"),
             )
+            for item in incoming
+        ])
     if "feedback" in pending:
         st.session_state["feedback"] = pending.get("feedback", "") or ""
 
@@ -148,6 +199,49 @@ def _hydrate_from_pending():
 _hydrate_from_pending()
 
 # ---------- HTTP ----------
+class _CappedRetry(Retry):
+    # urllib3 1.x sleeps for whatever Retry-After the server sends (2.x caps it
+    # at six hours), so clamp it to keep a 429/503 from freezing the app.
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, RETRY_AFTER_MAX)
+
+@st.cache_resource(show_spinner=False)
+def _http_session() -> requests.Session:
+    # One pooled session per process so repeat submits reuse the keep-alive
+    # connection instead of paying a fresh TCP + TLS handshake each time.
+    session = requests.Session()
+    # The webhook POST is not idempotent: a read timeout or a 502/504 can mean
+    # the workflow is still running, so only retry when the request never got
+    # through (connect errors) or the server asked us to come back later
+    # (429/503 with Retry-After).
+    retry = _CappedRetry(
+        total=3,
+        read=False,
+        status=1,
+        backoff_factor=0.3,
+        status_forcelist=(),
+        allowed_methods=frozenset(["POST"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def _json_dumps(obj) -> bytes:
+    if HAS_ORJSON:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+def _json_loads(data):
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
 def _build_headers():
     headers = {"Content-Type": "application/json"}
     if AUTH_HEADER:
@@ -158,36 +252,45 @@ def _build_headers():
             st.warning("N8N_AUTH_HEADER must be 'Header-Name: value'; ignoring.")
     return headers
 
-def _overlay_blocker():
-    if st.session_state.get("_waiting"):
-        st.markdown(
-            """
-            <div class="overlay">
-              <div class="overlay-inner">
-                <div class="big-spinner"></div>
-                <div class="overlay-text">Generating Outline…</div>
-              </div>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
+def _encode_body(payload: dict):
+    body = _json_dumps(payload)
+    headers = _build_headers()
+    if len(body) >= GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=3, mtime=0)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+_OVERLAY_HTML = """
+<div class="overlay">
+  <div class="overlay-inner">
+    <div class="big-spinner"></div>
+    <div class="overlay-text">Generating Outline…</div>
+  </div>
+</div>
+"""
+
+def _post_n8n(url: str, body: bytes, headers: dict) -> dict:
+    r = _http_session().post(url, data=body, timeout=WEBHOOK_TIMEOUT, headers=headers)
+    r.raise_for_status()
+    try:
+        raw = _json_loads(r.content)
+    except ValueError:
+        raw = r.text.strip()
+    return _normalize_n8n_response(raw)
 
 def call_n8n(payload: dict) -> dict:
     if not WEBHOOK_URL:
         st.error("N8N webhook URL is not configured. Set N8N_WEBHOOK_URL.")
         return {}
 
-    st.session_state["_waiting"] = True
-    _overlay_blocker()
+    # The overlay is streamed to the browser while the request blocks and is
+    # removed again as soon as it returns, success or not.
+    overlay = st.empty()
+    overlay.markdown(_OVERLAY_HTML, unsafe_allow_html=True)
     try:
+        body, headers = _encode_body(payload)
         try:
-            r = requests.post(
-                WEBHOOK_URL,
-                json=payload,
-                timeout=180,
-                headers=_build_headers(),
-            )
-            r.raise_for_status()
+            return _post_n8n(WEBHOOK_URL, body, headers)
         except requests.exceptions.RequestException as exc:
             status = getattr(getattr(exc, "response", None), "status_code", None)
             if status:
@@ -199,14 +302,8 @@ def call_n8n(payload: dict) -> dict:
                     "Failed to contact the automation service. Please check your connection and try again."
                 )
             return {}
-
-        try:
-            raw = r.json()
-        except json.JSONDecodeError:
-            raw = r.text.strip()
-        return _normalize_n8n_response(raw)
     finally:
-        st.session_state["_waiting"] = False
+        overlay.empty()
 
 def _safe_rerun():
     try:
@@ -221,29 +318,27 @@ def _safe_rerun():
 def _dnd(labels, ids, key):
     if not HAS_SORT or not labels:
         return None
-    try:
+    if SORT_HAS_IDS:
         _labels, new_ids = sort_items(labels, ids=ids, direction="vertical", key=key)
         return new_ids if new_ids != ids else None
-    except TypeError:
-        result = sort_items(labels, direction="vertical", key=key)
-        new_labels = result[0] if isinstance(result, tuple) else result
-        if new_labels == labels: return None
-        used = [0]*len(labels)
-        idxs = []
-        for lab in new_labels:
-            i = None
-            for j, orig in enumerate(labels):
-                if lab == orig and not used[j]:
-                    i = j; used[j]=1; break
-            if i is None:
-                i = labels.index(lab)
-            idxs.append(i)
-        return [ids[i] for i in idxs]
+    result = sort_items(labels, direction="vertical", key=key)
+    new_labels = result[0] if isinstance(result, tuple) else result
+    if len(new_labels) != len(labels) or new_labels == labels: return None
+    buckets = defaultdict(deque)
+    first = {}
+    for i, lab in enumerate(labels):
+        buckets[lab].append(i)
+        first.setdefault(lab, i)
+    idxs = [buckets[lab].popleft() if buckets[lab] else first[lab] for lab in new_labels]
+    return [ids[i] for i in idxs]
 
 # ---------- Utilities ----------
 def _reorder_group_by_ids(group, new_id_order):
-    id_to_item = {s["id"]: s for s in st.session_state["sections"][group]}
-    st.session_state["sections"][group] = [id_to_item[i] for i in new_id_order if i in id_to_item]
+    pos = {sid: i for i, sid in enumerate(new_id_order)}
+    last = len(pos)
+    # list.sort is stable, so sections missing from new_id_order keep their
+    # relative order at the end instead of being dropped.
+    st.session_state["sections"][group].sort(key=lambda s: pos.get(s["id"], last))
 
 def _move_item(group, idx, delta):
     items = st.session_state["sections"][group]
@@ -262,76 +357,58 @@ def _remove_item(group, idx):
     if 0 <= idx < len(items):
         items.pop(idx)
 
-def _level_raise(level):
-    i = LEVELS.index(level)
-    return LEVELS[max(i-1, 0)]
-
-def _level_lower(level):
-    i = LEVELS.index(level)
-    return LEVELS[min(i+1, len(LEVELS)-1)]
+def _move_to_group(group, idx, loc_key):
+    dest = st.session_state[loc_key]
+    if dest != group:
+        moved = st.session_state["sections"][group].pop(idx)
+        st.session_state["sections"][dest].append(moved)
 
-def _indent(level):
-    return " " * LEVELS.index(level)
+def _set_level(sec, level):
+    sec["heading"] = level
 
-def _get_widget_value_by_suffix(suffix: str, default):
-    for k, v in st.session_state.items():
-        if isinstance(k, str) and k.endswith(suffix):
-            return v
-    return default
+def _step_level(sec, steps):
+    # Looked up at click time so quick repeated clicks each take a step.
+    sec["heading"] = steps[sec["heading"]]
 
 # ---------- Snapshot ----------
+def _snapshot_item(sec: dict) -> dict:
+    return {
+        "H2": sec["heading_name"],
+        "Methodology": sec["description"],
+        "HeadingLevel": sec["heading"],
+        "Answer Type": sec["answer_type"],
+        "Answer Length": sec["answer_length"],
+        "lock": bool(sec["lock"]),
+        "Subsequent Sections?": "Yes" if sec["subsequent"] else "No",  # FIX: always include
+    }
+
+# Built after every card has rendered, so each section dict already mirrors its
+# widgets. The snapshot is exactly the webhook body; section ids and sidebar
+# labels travel alongside it in id_map / label_map (parallel lists per group).
 def build_snapshot():
+    state = st.session_state
     snap = {
-        "session_id": st.session_state["session_id"],
-        "H1": st.session_state.get("H1_text", ""),   # FIX: send H1 as string
-        "feedback": st.session_state.get("feedback", ""),
-        "MainContent": [],
-        "SupplementaryContent": [],
+        "session_id": state["session_id"],
+        "H1": state.get("H1_text", ""),   # FIX: send H1 as string
+        "feedback": state.get("feedback", ""),
     }
+    id_map, label_map = {}, {}
     for g in GROUPS:
-        for sec in st.session_state["sections"][g]:
-            sid = sec["id"]
-            hname = _get_widget_value_by_suffix(f"_{sid}_heading_name",
-                     st.session_state.get(f"{g}_{sid}_heading_name", sec["heading_name"]))
-            desc  = _get_widget_value_by_suffix(f"_{sid}_desc",
-                     st.session_state.get(f"{g}_{sid}_desc", sec["description"]))
-            atype = _get_widget_value_by_suffix(f"_{sid}_atype",
-                     st.session_state.get(f"{g}_{sid}_atype", sec["answer_type"]))
-            alen = _get_widget_value_by_suffix(
-                f"_{sid}_alen",
-                st.session_state.get(f"{g}_{sid}_alen", sec.get("answer_length", "Medium")),
-            )
-            locked = _get_widget_value_by_suffix(f"_{sid}_lock",
-                     st.session_state.get(f"{g}_{sid}_lock", sec["lock"]))
-            subq   = _get_widget_value_by_suffix(f"_{sid}_subseq",
-                     st.session_state.get(f"{g}_{sid}_subseq", sec["subsequent"]))
-
-            snap[g].append({
-                "H2": hname,
-                "Methodology": desc,
-                "HeadingLevel": sec["heading"],
-                "Answer Type": atype,
-                "Answer Length": alen if alen in ANSWER_LENGTHS else "Medium",
-                "lock": bool(locked),
-                "Subsequent Sections?": "Yes" if subq else "No",  # FIX: always include
-                "_id": sid,
-            })
-    return snap
-
-
-def build_webhook_body(snapshot: dict) -> dict:
-    body = {
-        "session_id": snapshot.get("session_id"),
-        "H1": snapshot.get("H1", ""),
-        "feedback": snapshot.get("feedback", ""),
-    }
-    for group in GROUPS:
-        items = []
-        for item in snapshot.get(group, []) or []:
-            clean = {k: v for k, v in item.items() if k != "_id"}
-            items.append(clean)
-        body[group] = items
-    return body
+        secs = state["sections"][g]
+        items = snap[g] = [_snapshot_item(sec) for sec in secs]
+        id_map[g] = [sec["id"] for sec in secs]
+        label_map[g] = [f"{LEVEL_INDENT[it['HeadingLevel']]}{(it['H2'] or '(untitled)').strip()}" for it in items]
+    return snap, id_map, label_map
+
+def _needs_generation(body: dict) -> bool:
+    # The workflow only fills in what is missing or unlocked; a fully locked
+    # outline with no feedback would come back unchanged.
+    if not body.get("H1") or body.get("feedback"):
+        return True
+    items = [item for group in GROUPS for item in body.get(group, [])]
+    if not items:
+        return True
+    return any(not item.get("lock") or item.get("Subsequent Sections?") == "Yes" for item in items)
 
 # ---------- UI ----------
 st.title("Content Brief Generator")
@@ -348,151 +425,142 @@ with c1:
 with c2:
     st.checkbox("Lock H1", key="H1_lock")
 
-def render_group(group):
-    st.subheader(GROUP_LABELS[group])
-    if st.button("➕ Add Section", key=f"add_{group}"):
-        _append_section(group); _safe_rerun()
-
-    items = st.session_state["sections"][group]
-
-    for idx, sec in enumerate(items):
-        sid = sec["id"]
-
-        st.markdown("<div class='section-card-wrap'></div>", unsafe_allow_html=True)
-        st.markdown("<div class='section-card'>", unsafe_allow_html=True)
-        st.markdown(
-            f"<div class='section-card-contents' id='section-{sid}' data-section-id='{sid}'>",
-            unsafe_allow_html=True,
-        )
-        st.markdown(
-            f"<div class='section-card-header' data-accordion-toggle data-section-id='{sid}'>",
-            unsafe_allow_html=True,
-        )
-
-        t = st.columns([0.06, 0.08, 0.08, 0.08, 0.12, 1, 0.30, 0.08], gap="small")
-        with t[0]:
-            st.markdown(
-                "<div class='accordion-toggle-icon' aria-hidden='true'></div>",
-                unsafe_allow_html=True,
-            )
-        if t[1].button("〈", key=f"dec_{group}_{sid}"):
-            sec["heading"] = _level_raise(sec["heading"]); _safe_rerun()
-        if t[2].button("＝", key=f"eq_{group}_{sid}"):
-            sec["heading"] = "H2"; _safe_rerun()
-        if t[3].button("〉", key=f"inc_{group}_{sid}"):
-            sec["heading"] = _level_lower(sec["heading"]); _safe_rerun()
-        t[4].markdown(f"<div class='level-chip'>{sec['heading']}</div>", unsafe_allow_html=True)
-
-        with t[6]:
-            loc = st.selectbox("Location", GROUPS, index=GROUPS.index(group),
-                               key=f"loc_{group}_{sid}", label_visibility="collapsed",
-                               format_func=lambda v: GROUP_LABELS[v])
-            if loc != group:
-                moved = st.session_state["sections"][group].pop(idx)
-                st.session_state["sections"][loc].append(moved); _safe_rerun()
-        with t[7]:
-            if st.button("🗑️", key=f"rm_{group}_{sid}"):
-                _remove_item(group, idx); _safe_rerun()
-
-        st.markdown("</div>", unsafe_allow_html=True)
-
-        st.markdown("<div class='section-card-header-body'>", unsafe_allow_html=True)
-
-        heading_level = sec.get("heading", "H2")
-        lock_value = bool(
-            st.session_state.get(f"{group}_{sid}_lock", sec.get("lock", False))
-        )
-        sec["lock"] = lock_value
-        section_path = f"{group}[{idx}].{heading_level}"
+# Per-section wrapper markup, filled with str.format_map once per card.
+_SECTION_HTML_OPEN = (
+    "<div class='section-card-wrap'></div>"
+    "<div class='section-card'>"
+    "<div class='section-card-contents' id='section-{sid}' data-section-id='{sid}'>"
+    "<div class='section-card-header' data-accordion-toggle data-section-id='{sid}'>"
+)
+_SECTION_HTML_HEADER_BODY = (
+    "</div>"
+    "<div class='section-card-header-body'>"
+    "<div class='heading-input-anchor' "
+    "data-anchor-key='{sid}' data-heading-id='{sid}' "
+    "data-section-path='{path}' "
+    "data-heading-level='{level}' "
+    "data-locked={locked}></div>"
+)
+_SECTION_HTML_BODY_OPEN = (
+    "</div>"
+    "<div class='section-card-body' data-accordion-panel data-section-id='{sid}'><div class='section-card-body-inner'>"
+    "<span id='section-{sid}-description' class='section-field-anchor'></span>"
+)
+_SECTION_FIELD_ANCHOR = "<span id='section-{sid}-{field}' class='section-field-anchor'></span>"
+_SECTION_HTML_CLOSE = "</div></div></div></div>"
+# Column ratios for the card header (toggle, level buttons, chip, spacer,
+# location, delete) and the action row beneath the fields.
+_CARD_TOP_RATIOS = (0.06, 0.08, 0.08, 0.08, 0.12, 1, 0.30, 0.08)
+_CARD_BOTTOM_RATIOS = (0.14, 0.14, 0.20, 0.22, 0.22)
+
+# Not a fragment: the sidebar outline, TSV export, debug payload and
+# quick-regen data all read the cards, so any edit has to rerun the app.
+def _render_card(group, idx, sec):
+    sid = sec["id"]
+    prefix = f"{group}_{sid}_"
+    keys = {field: prefix + field for field in WIDGET_FIELDS}
+    loc_key = prefix + "loc"
+
+    # Widgets are key-only: seed their state from the section the first time
+    # they render (or after a move changes their keys) and let Streamlit own
+    # the value from then on.
+    state = st.session_state
+    state.setdefault(loc_key, group)
+    state.setdefault(keys["heading_name"], sec["heading_name"])
+    state.setdefault(keys["desc"], sec["description"])
+    state.setdefault(keys["atype"], sec["answer_type"])
+    state.setdefault(keys["alen"], sec["answer_length"])
+    state.setdefault(keys["lock"], bool(sec["lock"]))
+    state.setdefault(keys["subseq"], bool(sec["subsequent"]))
+
+    fmt = {"sid": sid}
+    st.markdown(_SECTION_HTML_OPEN.format_map(fmt), unsafe_allow_html=True)
+
+    t = st.columns(_CARD_TOP_RATIOS, gap="small")
+    with t[0]:
         st.markdown(
-            "<div class='heading-input-anchor' "
-            f"data-anchor-key='{sid}' data-heading-id='{sid}' "
-            f"data-section-path='{html.escape(section_path)}' "
-            f"data-heading-level='{heading_level}' "
-            f"data-locked={'true' if lock_value else 'false'}></div>",
+            "<div class='accordion-toggle-icon' aria-hidden='true'></div>",
             unsafe_allow_html=True,
         )
-        current_heading_value = st.session_state.get(
-            f"{group}_{sid}_heading_name", sec["heading_name"]
-        )
-        sec["heading_name"] = st.text_input(
-            "Heading Name",
-            key=f"{group}_{sid}_heading_name",
-            value=current_heading_value,
-        )
+    t[1].button("〈", key=prefix + "dec",
+                on_click=_step_level, args=(sec, LEVEL_RAISE))
+    t[2].button("＝", key=prefix + "eq",
+                on_click=_set_level, args=(sec, "H2"))
+    t[3].button("〉", key=prefix + "inc",
+                on_click=_step_level, args=(sec, LEVEL_LOWER))
+    t[4].markdown(f"<div class='level-chip'>{sec['heading']}</div>", unsafe_allow_html=True)
+
+    with t[6]:
+        st.selectbox("Location", GROUPS, key=loc_key,
+                     label_visibility="collapsed", format_func=_group_label,
+                     on_change=_move_to_group, args=(group, idx, loc_key))
+    with t[7]:
+        st.button("🗑️", key=prefix + "rm",
+                  on_click=_remove_item, args=(group, idx))
+
+    heading_level = sec.get("heading", "H2")
+    lock_value = sec["lock"] = bool(state[keys["lock"]])
+    st.markdown(
+        _SECTION_HTML_HEADER_BODY.format(
+            sid=sid,
+            path=html.escape(f"{group}[{idx}].{heading_level}"),
+            level=heading_level,
+            locked="true" if lock_value else "false",
+        ),
+        unsafe_allow_html=True,
+    )
+    sec["heading_name"] = st.text_input("Heading Name", key=keys["heading_name"])
+
+    st.markdown(_SECTION_HTML_BODY_OPEN.format_map(fmt), unsafe_allow_html=True)
+    sec["description"] = st.text_area("Description", key=keys["desc"], height=140)
+    st.markdown(_SECTION_FIELD_ANCHOR.format(sid=sid, field="answer-type"), unsafe_allow_html=True)
+    sec["answer_type"] = st.radio(
+        "Answer Type",
+        ANSWER_TYPES,
+        key=keys["atype"],
+        horizontal=True,
+    )
+    st.markdown(_SECTION_FIELD_ANCHOR.format(sid=sid, field="answer-length"), unsafe_allow_html=True)
+    sec["answer_length"] = st.radio(
+        "Answer Length",
+        ANSWER_LENGTHS,
+        key=keys["alen"],
+        horizontal=True,
+    )
 
-        st.markdown("</div>", unsafe_allow_html=True)
+    b = st.columns(_CARD_BOTTOM_RATIOS, gap="small")
+    with b[0]:
+        st.button("⬆️ Up", key=prefix + "up",
+                  on_click=_move_item, args=(group, idx, -1))
+    with b[1]:
+        st.button("⬇️ Down", key=prefix + "down",
+                  on_click=_move_item, args=(group, idx, 1))
+    with b[2]:
+        st.button("➕ Insert Below", key=prefix + "ins",
+                  on_click=_insert_below, args=(group, idx))
+    with b[3]:
+        sec["lock"] = st.checkbox("Lock Section", key=keys["lock"])
+    with b[4]:
+        sec["subsequent"] = st.checkbox("Generate Subsequent Sections?", key=keys["subseq"])
+
+    st.markdown(_SECTION_HTML_CLOSE, unsafe_allow_html=True)
 
-        st.markdown(
-            f"<div class='section-card-body' data-accordion-panel data-section-id='{sid}'><div class='section-card-body-inner'>",
-            unsafe_allow_html=True,
-        )
+def render_group(group):
+    st.subheader(GROUP_LABELS[group])
+    st.button("➕ Add Section", key=f"add_{group}", on_click=_append_section, args=(group,))
 
-        st.markdown(
-            f"<span id='section-{sid}-description' class='section-field-anchor'></span>",
-            unsafe_allow_html=True,
-        )
-        sec["description"] = st.text_area(
-            "Description",
-            key=f"{group}_{sid}_desc",
-            value=sec["description"],
-            height=140,
-        )
-        answer_type_value = sec["answer_type"] if sec["answer_type"] in ANSWER_TYPES else "Auto"
-        st.markdown(
-            f"<span id='section-{sid}-answer-type' class='section-field-anchor'></span>",
-            unsafe_allow_html=True,
-        )
-        sec["answer_type"] = st.radio(
-            "Answer Type",
-            ANSWER_TYPES,
-            key=f"{group}_{sid}_atype",
-            index=ANSWER_TYPES.index(answer_type_value),
-            horizontal=True,
-        )
-        answer_length_value = sec.get("answer_length", "Medium")
-        if answer_length_value not in ANSWER_LENGTHS:
-            answer_length_value = "Medium"
-        st.markdown(
-            f"<span id='section-{sid}-answer-length' class='section-field-anchor'></span>",
-            unsafe_allow_html=True,
-        )
-        sec["answer_length"] = st.radio(
-            "Answer Length",
-            ANSWER_LENGTHS,
-            key=f"{group}_{sid}_alen",
-            index=ANSWER_LENGTHS.index(answer_length_value),
-            horizontal=True,
-        )
+    for idx, sec in enumerate(st.session_state["sections"][group]):
+        _render_card(group, idx, sec)
 
-        b = st.columns([0.14, 0.14, 0.20, 0.22, 0.22], gap="small")
-        with b[0]:
-            if st.button("⬆️ Up", key=f"up_{group}_{sid}"):
-                _move_item(group, idx, -1); _safe_rerun()
-        with b[1]:
-            if st.button("⬇️ Down", key=f"down_{group}_{sid}"):
-                _move_item(group, idx, 1); _safe_rerun()
-        with b[2]:
-            if st.button("➕ Insert Below", key=f"ins_{group}_{sid}"):
-                _insert_below(group, idx); _safe_rerun()
-        with b[3]:
-            sec["lock"] = st.checkbox("Lock Section", key=f"{group}_{sid}_lock", value=sec["lock"])
-        with b[4]:
-            sec["subsequent"] = st.checkbox("Generate Subsequent Sections?", key=f"{group}_{sid}_subseq", value=sec["subsequent"])
-
-        st.markdown("</div></div>", unsafe_allow_html=True)
-        st.markdown("</div>", unsafe_allow_html=True)
-        st.markdown("</div>", unsafe_allow_html=True)
 
 for g in GROUPS:
     render_group(g)
 
-snapshot = build_snapshot()
-webhook_body = build_webhook_body(snapshot)
+snapshot, id_map, label_map = build_snapshot()
 
 quick_regen_data = {
     "webhook": QUICK_REGEN_WEBHOOK_URL,
-    "body": webhook_body,
+    "body": snapshot,
     "envelope": {
         "headers": {"content-type": "application/json"},
         "params": {},
@@ -509,8 +577,7 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-st.markdown(
-    """
+_ENHANCEMENTS_JS = """
     <script>
     (function () {
       const INTERACTIVE_SELECTOR = 'button, input, textarea, select, label, [role="button"], [role="checkbox"], [role="radio"], [role="switch"], [contenteditable="true"]';
@@ -784,41 +851,41 @@ st.markdown(
       window.__CBGEnhancements.refresh();
     })();
     </script>
-    """,
-    unsafe_allow_html=True,
-)
+    """
+
+# The script installs its listeners idempotently on window, so it only needs
+# to reach the browser once per session.
+if not st.session_state.get("_js_emitted"):
+    st.markdown(_ENHANCEMENTS_JS, unsafe_allow_html=True)
+    st.session_state["_js_emitted"] = True
 
 # ---------- Sidebar ----------
 with st.sidebar:
     st.markdown("## Outline Overview")
     for g in GROUPS:
         st.markdown(f"**{GROUP_LABELS[g]}**")
-        items = snapshot[g]
+        items, item_ids = snapshot[g], id_map[g]
         if not items:
             st.caption("No sections yet."); st.markdown("---"); continue
+        hidden_ids = []
+        if len(items) > MAX_SIDEBAR_ITEMS and not st.session_state.get(f"_sidebar_show_all_{g}"):
+            hidden_ids = item_ids[MAX_SIDEBAR_ITEMS:]
+            items = items[:MAX_SIDEBAR_ITEMS]
 
-        labels = [f"{_indent(it['HeadingLevel'])}{(it['H2'] or '(untitled)').strip()}" for it in items]
-        ids = [it["_id"] for it in items]
+        labels, ids = label_map[g][:len(items)], item_ids[:len(items)]
         outline_meta = []
-        for it in items:
-            heading_text = (it.get("H2") or "").strip()
-            display_text = heading_text or "(untitled)"
-            level = it.get("HeadingLevel")
-            try:
-                indent_level = LEVELS.index(level)
-            except ValueError:
-                indent_level = 0
+        for it, sid in zip(items, ids):
             outline_meta.append(
                 {
-                    "id": it["_id"],
-                    "target": f"section-{it['_id']}",
-                    "label": display_text,
-                    "indent": indent_level,
+                    "id": sid,
+                    "target": f"section-{sid}",
+                    "label": (it.get("H2") or "").strip() or "(untitled)",
+                    "indent": LEVEL_IDX.get(it.get("HeadingLevel"), 0),
                 }
             )
 
         if HAS_SORT and labels:
-            meta_json = html.escape(json.dumps(outline_meta))
+            meta_json = html.escape(json.dumps(outline_meta, separators=(",", ":")))
             st.markdown(
                 f"<div class='sidebar-outline-block' data-outline-group='{g}' "
                 f"data-outline-meta='{meta_json}'>",
@@ -827,7 +894,7 @@ with st.sidebar:
             new_order = _dnd(labels, ids, key=f"sidebar_sort_{g}")
             st.markdown("</div>", unsafe_allow_html=True)
             if new_order:
-                _reorder_group_by_ids(g, new_order); _safe_rerun()
+                _reorder_group_by_ids(g, new_order + hidden_ids); _safe_rerun()
         else:
             jump_html_parts = []
             for meta in outline_meta:
@@ -842,41 +909,52 @@ with st.sidebar:
                     "<div class='sidebar-jump-list'>" + "".join(jump_html_parts) + "</div>",
                     unsafe_allow_html=True,
                 )
+        if hidden_ids and st.button(f"Show remaining {len(hidden_ids)}", key=f"sidebar_more_{g}"):
+            st.session_state[f"_sidebar_show_all_{g}"] = True; _safe_rerun()
         st.markdown("---")
 
-    st.text_area("Overall feedback", key="feedback", placeholder="Optional suggestions…", height=120)
     with st.form("sidebar_submit"):
+        st.text_area("Overall feedback", key="feedback", placeholder="Optional suggestions…", height=120)
         sent = st.form_submit_button("Send / Update", use_container_width=True)
 
     with st.expander("Debug (optional)"):
-        preview = {"session_id": snapshot["session_id"], "H1": snapshot["H1"], "feedback": snapshot["feedback"]}
-        for g in GROUPS:
-            preview[g] = [{k: v for k, v in d.items() if k != "_id"} for d in snapshot[g]]
-        st.json(preview)
+        # The expander body runs even when collapsed; only serialize on request.
+        if st.checkbox("Show payload", key="_debug_show_payload"):
+            st.json(snapshot)
 
 # ---------- Send ----------
 if sent:
-    payload = build_webhook_body(snapshot)
-    resp = call_n8n(payload)
-    if resp:
-        staged = {"H1": resp.get("H1", ""), "MainContent": resp.get("MainContent", []),
-                  "SupplementaryContent": resp.get("SupplementaryContent", []),
-                  "feedback": resp.get("feedback", "")}
-        st.session_state["_pending_hydration"] = staged
-    _safe_rerun()
+    payload = snapshot
+    if not _needs_generation(payload):
+        st.info("Every section is locked and there is no feedback; nothing to regenerate.")
+    else:
+        resp = call_n8n(payload)
+        if resp:
+            staged = {"H1": resp.get("H1", ""), "MainContent": resp.get("MainContent", []),
+                      "SupplementaryContent": resp.get("SupplementaryContent", []),
+                      "feedback": resp.get("feedback", "")}
+            st.session_state["_pending_hydration"] = staged
+        _safe_rerun()
 
 # ---------- TSV ----------
-rows = []
-rows.append(("H1", (st.session_state.get("H1_text") or "").strip(), "", "", "", "Title"))
-for g in GROUPS:
-    for sec in st.session_state["sections"][g]:
+TSV_HEADER = "Heading\tHeading Name\tDescription\tAnswerType\tAnswerLength\tLocation"
+# Tabs become spaces and line breaks become a literal "\n", in one pass.
+_TSV_TRANS = str.maketrans({"\t": " ", "\r": "", "\n": "\\n"})
+
+def _tsv_desc(text: str) -> str:
+    return (text or "").translate(_TSV_TRANS).strip()
+
+def _iter_tsv_rows(snapshot: dict):
+    yield ("H1", (snapshot.get("H1") or "").strip(), "", "", "", "Title")
+    for g in GROUPS:
         location = "Main" if g == "MainContent" else "Supplementary"
-        rows.append((sec["heading"], (sec["heading_name"] or "").strip(),
-                     (sec["description"] or "").replace("\t", " ").replace("\r\n", "\\n").replace("\n", "\\n").strip(),
-                     sec["answer_type"], sec.get("answer_length", "Medium"), location))
-tsv_lines = ["Heading\tHeading Name\tDescription\tAnswerType\tAnswerLength\tLocation"]
-tsv_lines += ["\t".join(r) for r in rows]
-tsv_blob = "\n".join(tsv_lines)
+        for it in snapshot[g]:
+            yield (it["HeadingLevel"], (it["H2"] or "").strip(),
+                   _tsv_desc(it["Methodology"]),
+                   it["Answer Type"], it["Answer Length"], location)
+
+tsv_blob = TSV_HEADER + "\n" + "\n".join("\t".join(r) for r in _iter_tsv_rows(snapshot))
 st.markdown("### TSV")
-st.code(tsv_blob, language="text")
-st.download_button("Download TSV", data=tsv_blob, file_name="content_brief.tsv", mime="text/tab-separated-values")
+with st.expander("Preview TSV", expanded=False):
+    st.code(tsv_blob, language="text")
+st.download_button("Download TSV", data=tsv_blob.encode("utf-8"), file_name="content_brief.tsv", mime="text/tab-separated-values")